@@ -4,18 +4,17 @@ import argparse
 import sys
 
 def main():
-    from .workforce import worker
-    from .gui import gui
     parser = argparse.ArgumentParser()
     parser.add_argument("-r", "--run", required=False)
     parser.add_argument("pipeline", nargs='?')
     args = parser.parse_args()
+    # Import lazily so running a plan never pays for loading Dash
     if args.run:
-        worker(args.run)
-    elif args.pipeline:
-        gui(args.pipeline)
+        from .workforce import worker
+        return worker(args.run)
     else:
-        gui()
+        from .gui import gui
+        gui(args.pipeline)
     return 0
 
 
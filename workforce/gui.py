@@ -5,13 +5,9 @@ import base64
 import dash_cytoscape as cyto
 import datetime
 import io
-import json
-import numpy as np
-import pandas as pd
 import subprocess
 import webbrowser
 import networkx as nx
-from networkx.readwrite import json_graph
 
 def gui(pipeline_file=None):
     app = Dash(__name__)
@@ -161,30 +157,26 @@ def handle_upload(contents):
 def load(pipeline_file):
     # Reads graphml format and converts to dash-cytoscape json using nx
     G = nx.read_graphml(pipeline_file)
-    graph = json_graph.node_link_data(G)
-    elements = graph['nodes'] + graph['links']
     dash_cytoscape_data = []
-    for element in elements:
-        if 'source' in element and 'target' in element:
-            updated_element = {
-                'data': {
-                    'source': element.get('source'),
-                    'target': element.get('target'),
-                    'id': element.get('id')
-                }
+    for node, data in G.nodes(data=True):
+        dash_cytoscape_data.append({
+            'data': {
+                'label': data.get('label'),
+                'id': node
+            },
+            'position': {
+                'x': float(data.get('x', 0)),
+                'y': float(data.get('y', 0))
             }
-        else:
-            updated_element = {
-                'data': {
-                    'label': element.get('label'),
-                    'id': element.get('id')
-                },
-                'position': {
-                    'x': float(element.get('x', 0)),
-                    'y': float(element.get('y', 0))
-                }
+        })
+    for source, target, data in G.edges(data=True):
+        dash_cytoscape_data.append({
+            'data': {
+                'source': source,
+                'target': target,
+                'id': data.get('id')
             }
-        dash_cytoscape_data.append(updated_element)
+        })
     return dash_cytoscape_data
 
 def add_node(elements, txt_node):
@@ -204,19 +196,26 @@ def remove(elements, selected_nodes, selected_edges):
 def connect_nodes(elements, selected_nodes):
     if len(selected_nodes) < 2:
         return elements
+    existing_edges = {(el['data'].get('source'), el['data'].get('target')) for el in elements}
     for i in range(len(selected_nodes) - 1):
         source_node = selected_nodes[i]['id']
         target_node = selected_nodes[i + 1]['id']
-        elements.append({'data': {'source': source_node, 'target': target_node}})
+        if (source_node, target_node) not in existing_edges:
+            elements.append({'data': {'source': source_node, 'target': target_node}})
+            existing_edges.add((source_node, target_node))
     return elements
 
 def update_node(elements, selected_nodes, txt_node_value):
-    if len(selected_nodes) == 1:
-        selected_id = selected_nodes[0]['id']
-        for element in elements:
-            if element['data'].get('id') == selected_id:
-                element['data']['label'] = txt_node_value
-                break
+    if len(selected_nodes) != 1:
+        return dash.no_update
+    selected_id = selected_nodes[0]['id']
+    for element in elements:
+        if element['data'].get('id') == selected_id:
+            # selectedNodeData isn't refreshed on label edits, so compare with the element itself
+            if element['data'].get('label') == txt_node_value:
+                return dash.no_update
+            element['data']['label'] = txt_node_value
+            break
     return elements
 
 def save_elements(elements):
@@ -231,7 +230,7 @@ def save_elements(elements):
             pos = element.get('position', {})
             G.add_node(node_id, label=label, x=pos.get('x', 0), y=pos.get('y', 0))
     graphml_bytes = io.BytesIO()
-    nx.write_graphml(G, graphml_bytes)
+    nx.write_graphml_lxml(G, graphml_bytes)
     graphml_bytes.seek(0)
     return dcc.send_string(graphml_bytes.getvalue().decode('utf-8'), 'network_data.graphml')
 
@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 import os
+import shutil
+import signal
+import sys
 import time
 import subprocess
+import tempfile
 import networkx as nx
 import multiprocessing
 from filelock import FileLock
@@ -11,33 +15,53 @@ def read_graph(filename):
     return nx.read_graphml(filename)
 
 def write_graph(G, filename):
-    nx.write_graphml(G, filename)
-
-def update_node_status(filename, node, status, lock):
-    with lock:
-        G = read_graph(filename)
-        nx.set_node_attributes(G, {node: status}, 'status')
-        write_graph(G, filename)
+    # Write beside the target and rename over it so readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix=os.path.basename(filename) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            nx.write_graphml_lxml(G, f, prettyprint=False)
+        # mkstemp creates 0600 files, so keep the mode the working copy was created with
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
-def execute_node(filename, node, lock):
-    with lock:
-        G = read_graph(filename)
-    update_node_status(filename, node, 'running', lock)
+def execute_node(filename, node, command):
+    lock = FileLock(f"{filename}.lock")
+    process = None
     try:
-        subprocess.run(G.nodes[node].get('label'), shell=True, check=True)
-        update_node_status(filename, node, 'ran', lock)
-    except subprocess.CalledProcessError:
-        update_node_status(filename, node, 'fail', lock)
-    schedule_tasks(filename, lock)
+        try:
+            # Own session, so stopping the run reaches everything the command started and not just its shell
+            process = subprocess.Popen(command, shell=True, start_new_session=True)
+            status = 'ran' if process.wait() == 0 else 'fail'
+        except Exception as error:
+            # A command that can't start (e.g. a node without a label) is a failed node, not a dead worker
+            print(f"workforce: could not run {command!r}: {error}", file=sys.stderr)
+            status = 'fail'
+        schedule_tasks(filename, lock, {node: status})
+        # Successors are forked from here, so wait on them where a SIGTERM can still pass it on
+        [p.join() for p in multiprocessing.active_children()]
+    except (KeyboardInterrupt, SystemExit):
+        if process is not None:
+            stop_command(process)
+        stop_children()
+        raise
 
-def schedule_tasks(filename, lock):
+def schedule_tasks(filename, lock, finished=None):
     with lock:
         G = read_graph(filename)
+        # Apply the finished node's status in the same pass that schedules its successors
+        if finished:
+            nx.set_node_attributes(G, finished, 'status')
         node_status = nx.get_node_attributes(G, 'status')
         edge_status = nx.get_edge_attributes(G, 'status')
-        if not node_status or edge_status:
+        no_roots = False
+        if not node_status and not edge_status:
             node_updates = {node:'run' for node, degree in G.in_degree() if degree == 0}
             nx.set_node_attributes(G, node_updates, 'status')
+            no_roots = bool(G) and not node_updates
         else:
             ran_nodes = [node for node, status in node_status.items() if status == 'ran']
             forward_edges = [(u, v) for node in ran_nodes for u, v in G.out_edges(node)]
@@ -45,40 +69,82 @@ def schedule_tasks(filename, lock):
             nx.set_edge_attributes(G, edge_updates, 'status')
             [G.nodes[node].pop('status', None) for node in ran_nodes]
             edge_status = nx.get_edge_attributes(G, 'status')
-            target_nodes = [v for _, v in edge_status]
-            unique_nodes = set(node for node in target_nodes)
+            target_nodes = set(v for _, v in edge_status)
+            in_edges = {node: list(G.in_edges(node)) for node in target_nodes}
+            unique_nodes = set(node for node in target_nodes if all(edge in edge_status for edge in in_edges[node]))
             run = {node: 'run' for node in unique_nodes}
             nx.set_node_attributes(G, run, 'status')
-            reverse_edges = [(u, v) for node in run for u, v in G.in_edges(node)]
+            reverse_edges = [edge for node in run for edge in in_edges[node]]
             [G.edges[edge].pop('status', None) for edge in reverse_edges]
+        nodes_to_run = {node: G.nodes[node].get('label') for node, status in nx.get_node_attributes(G, 'status').items() if status == 'run'}
+        nx.set_node_attributes(G, {node: 'running' for node in nodes_to_run}, 'status')
         write_graph(G, filename)
-        #run_complete = not bool(nx.get_node_attributes(G, 'status'))
-        if bool(nx.get_node_attributes(G, 'status')):
-            run_tasks(filename, lock)
-        else:
-            os.remove(filename + '.lock')
-            os.remove(filename)
-    #return run_complete
+        node_status = nx.get_node_attributes(G, 'status')
+        edge_status = nx.get_edge_attributes(G, 'status')
+        if not node_status and not edge_status and not no_roots:
+            remove_run_files(filename)
+        elif not any(status in ('run', 'running') for status in node_status.values()):
+            report_stalled(G, filename)
+            # Nothing is left to contend for the working copy, so only it is kept
+            os.remove(f"{filename}.lock")
+    # Fork only once the lock is released so children take their own flock
+    run_tasks(filename, nodes_to_run)
 
-def run_tasks(filename, lock):
-    with lock:
-        G = read_graph(filename)
-        nodes_to_run = [ node for node, status in nx.get_node_attributes(G, 'status').items() if status == 'run' ]
-    processes = []
-    [multiprocessing.Process(target=execute_node, args=(filename, node, lock)).start() for node in nodes_to_run]
+def run_tasks(filename, nodes_to_run):
+    [multiprocessing.Process(target=execute_node, args=(filename, node, command)).start() for node, command in nodes_to_run.items()]
+
+def report_stalled(G, filename):
+    # Nothing left running but the plan isn't done: a node failed or a cycle blocks its successors
+    failed = [G.nodes[node].get('label', node) for node, status in nx.get_node_attributes(G, 'status').items() if status == 'fail']
+    waiting = set(G.nodes[v].get('label', v) for _, v in nx.get_edge_attributes(G, 'status'))
+    print(f"workforce: run stalled, working copy kept at {filename}", file=sys.stderr)
+    if failed:
+        print(f"workforce: failed: {', '.join(failed)}", file=sys.stderr)
+    if waiting:
+        print(f"workforce: waiting on unfinished predecessors: {', '.join(sorted(waiting))}", file=sys.stderr)
+    if not failed and not waiting:
+        print("workforce: every node has a predecessor, so nothing could start", file=sys.stderr)
+
+def stop_command(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+def stop_children():
+    [p.terminate() for p in multiprocessing.active_children()]
+    [p.join() for p in multiprocessing.active_children()]
+
+def remove_run_files(filename):
+    for path in (filename, f"{filename}.lock"):
+        if os.path.exists(path):
+            os.remove(path)
 
 def worker(filename):
     multiprocessing.set_start_method('fork')
+    for signum in (signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, lambda signum, frame: sys.exit(128 + signum))
     #tasks = [schedule_tasks, run_tasks]
     #processes = [Process(target=task, args=(filename, lock)) for task in tasks]
     #[p.start() for p in processes]
     #[p.join() for p in processes]
     #os.remove(f"{filename}.lock")
-    G = read_graph(filename)
-    filename = f"{os.getpid()}_{os.path.basename(filename)}"
-    write_graph(G, filename)
+    working = f"{os.getpid()}_{os.path.basename(filename)}"
+    shutil.copyfile(filename, working)
+    filename = working
     lock = FileLock(f"{filename}.lock")
-    schedule_tasks(filename, lock)
+    try:
+        schedule_tasks(filename, lock)
+        [p.join() for p in multiprocessing.active_children()]
+    except (KeyboardInterrupt, SystemExit):
+        # Don't leave workers or the working copy and its lock behind on Ctrl-C, SIGTERM or SIGHUP.
+        # Each worker stops its own successors before exiting, so this waits for the whole tree.
+        stop_children()
+        remove_run_files(filename)
+        raise
+    # The working copy only survives a run that stalled
+    return 1 if os.path.exists(filename) else 0
     #completed = schedule_tasks(filename, lock)
     #while True:
         #time.sleep(1)
@@ -94,5 +160,5 @@ if __name__ == "__main__":
     parser.add_argument("filename", help="Path to the GraphML file")
     args = parser.parse_args()
     
-    worker(args.filename)
+    sys.exit(worker(args.filename))
 